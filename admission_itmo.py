@@ -0,0 +1,162 @@
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from config_itmo import (
+    MAX_ACTIVE_SESSIONS, WAITING_TICKET_TTL_SECONDS, EXPECTED_SESSION_SECONDS, QUEUE_POLL_SECONDS
+)
+
+#########Допуск новых интервью
+# Одновременно идет не больше MAX_ACTIVE_SESSIONS интервью. Новые кандидаты сверх лимита
+# получают билет и ждут в FIFO очереди, освободившееся место сразу отдается первому в очереди.
+# Кандидаты посреди интервью не ограничиваются: лимит действует только на /start.
+
+# вес последней сессии в скользящей средней длительности
+DURATION_EMA_ALPHA = 0.2
+
+
+class TicketNotFound(Exception):
+    """Билета нет: не выдавался или истек"""
+
+
+class TicketAlreadyClaimed(Exception):
+    """По билету уже запускается интервью"""
+
+
+class AdmissionController:
+    def __init__(self, max_active: int, ticket_ttl: float, expected_session_seconds: float):
+        self.max_active = max_active
+        self.ticket_ttl = ticket_ttl
+        self.avg_session_seconds = expected_session_seconds
+        self._lock = threading.Lock()
+        # session_id -> время старта
+        self._active: Dict[str, float] = {}
+        # билеты, которым уже выделено место, но интервью еще не запущено: ticket_id -> время выделения,
+        # None - по билету уже идет /start, такой билет не истекает
+        self._reserved: Dict[str, Optional[float]] = {}
+        # очередь ожидания: ticket_id -> время последнего опроса
+        self._waiting: "OrderedDict[str, float]" = OrderedDict()
+        self._metrics = {
+            'admitted_immediately': 0,
+            'queued': 0,
+            'promoted': 0,
+            'started': 0,
+            'finished': 0,
+            'abandoned_tickets': 0
+        }
+
+    def _free_slots(self) -> int:
+        return self.max_active - len(self._active) - len(self._reserved)
+
+    def _sweep(self) -> None:
+        """Убираем брошенные билеты и отдаем места очереди. Вызывается под self._lock"""
+        now = time.monotonic()
+        for ticket_id, polled_at in list(self._waiting.items()):
+            if now - polled_at > self.ticket_ttl:
+                del self._waiting[ticket_id]
+                self._metrics['abandoned_tickets'] += 1
+        for ticket_id, reserved_at in list(self._reserved.items()):
+            if reserved_at is not None and now - reserved_at > self.ticket_ttl:
+                del self._reserved[ticket_id]
+                self._metrics['abandoned_tickets'] += 1
+
+        while self._waiting and self._free_slots() > 0:
+            ticket_id, _ = self._waiting.popitem(last=False)
+            self._reserved[ticket_id] = now
+            self._metrics['promoted'] += 1
+
+    def _status(self, ticket_id: str) -> Dict[str, Any]:
+        if ticket_id in self._reserved:
+            return {'admitted': True, 'ticket_id': ticket_id}
+
+        position = list(self._waiting).index(ticket_id) + 1
+        # места освобождаются в среднем раз в avg_session_seconds / max_active
+        eta_seconds = math.ceil(position * self.avg_session_seconds / max(self.max_active, 1))
+        return {
+            'admitted': False,
+            'ticket_id': ticket_id,
+            'position': position,
+            'eta_seconds': eta_seconds,
+            'poll_after_seconds': QUEUE_POLL_SECONDS
+        }
+
+    def enter(self) -> Dict[str, Any]:
+        """Новый кандидат на /start: сразу занимаем место или ставим в очередь"""
+        ticket_id = str(uuid.uuid4())
+        with self._lock:
+            self._sweep()
+            if not self._waiting and self._free_slots() > 0:
+                self._reserved[ticket_id] = None
+                self._metrics['admitted_immediately'] += 1
+            else:
+                self._waiting[ticket_id] = time.monotonic()
+                self._metrics['queued'] += 1
+            return self._status(ticket_id)
+
+    def poll(self, ticket_id: str, claim: bool = False) -> Dict[str, Any]:
+        """
+        Статус билета, опрос продлевает билет. claim=True - по билету запускается /start,
+        выделенное место закрепляется за ним до activate / release_ticket
+        """
+        with self._lock:
+            if ticket_id in self._reserved and self._reserved[ticket_id] is None:
+                raise TicketAlreadyClaimed(ticket_id)
+            if ticket_id in self._waiting:
+                self._waiting[ticket_id] = time.monotonic()
+            elif ticket_id in self._reserved:
+                self._reserved[ticket_id] = time.monotonic()
+            self._sweep()
+            if ticket_id not in self._waiting and ticket_id not in self._reserved:
+                raise TicketNotFound(ticket_id)
+            if claim and ticket_id in self._reserved:
+                self._reserved[ticket_id] = None
+            return self._status(ticket_id)
+
+    def activate(self, ticket_id: str, session_id: str) -> None:
+        """Интервью по билету запущено: место переходит от билета к сессии"""
+        with self._lock:
+            self._reserved.pop(ticket_id, None)
+            self._active[session_id] = time.monotonic()
+            self._metrics['started'] += 1
+
+    def release_ticket(self, ticket_id: str) -> None:
+        """Интервью по билету так и не запустилось (ошибка на /start)"""
+        with self._lock:
+            self._reserved.pop(ticket_id, None)
+            self._waiting.pop(ticket_id, None)
+            self._sweep()
+
+    def finish(self, session_id: str, completed: bool = True) -> None:
+        """
+        Сессия завершена (completed) или брошена. Место уходит первому в очереди
+        """
+        with self._lock:
+            started_at = self._active.pop(session_id, None)
+            if started_at is None:
+                return
+            if completed:
+                duration = time.monotonic() - started_at
+                self.avg_session_seconds += DURATION_EMA_ALPHA * (duration - self.avg_session_seconds)
+                self._metrics['finished'] += 1
+            self._sweep()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._metrics,
+                'max_active': self.max_active,
+                'active': len(self._active),
+                'reserved': len(self._reserved),
+                'waiting': len(self._waiting),
+                'avg_session_seconds': round(self.avg_session_seconds, 1)
+            }
+
+
+admission_controller = AdmissionController(
+    max_active=MAX_ACTIVE_SESSIONS,
+    ticket_ttl=WAITING_TICKET_TTL_SECONDS,
+    expected_session_seconds=EXPECTED_SESSION_SECONDS
+)
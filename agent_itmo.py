@@ -1,20 +1,27 @@
 from typing import List, Tuple, Dict, Any
 from pydantic import HttpUrl, BaseModel, Field
 
-from config_itmo import OPEN_AI_API_KEY
+from config_itmo import OPEN_AI_API_KEY, LLM_TIMEOUT_SECONDS
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 import json
+import time
 from pathlib import Path
 from datetime import datetime
 
 # Папка для json логов интервью 
 INTERVIEW_LOGS_DIR = Path(__file__).resolve().parent / "interview_logs"
 
-from req_resp_itmo import Request_class, Response_class, Single_turn, Question_class, FinalReport, ThinkingAgentResponse, LogTurn, InterviewLog, StopIntentResponse
+from req_resp_itmo import Request_class, Response_class, Single_turn, Question_class, FinalReport, FinalReportNarrative, ThinkingAgentResponse, LogTurn, InterviewLog, StopIntentResponse, ScoreBoard, ScoreVerdict, PolicySignals
+from scoring_itmo import update_score_board, score_verdict
+from deadline_itmo import invoke_llm, call_llm, DeadlineExceeded
+from policy_itmo import STOP_REASONS, response_tokens, update_signals, evaluate_stop_policy
+from analysis_cache_itmo import analysis_cache, question_class, question_key
 from langgraph.checkpoint.memory import MemorySaver
 
 
@@ -62,7 +69,8 @@ roadmap персональный:
     interview_log = InterviewLog(
         participant_name=state['first_request'].name,
         turns=turns,
-        final_feedback=final_feedback.strip()
+        final_feedback=final_feedback.strip(),
+        stop_reason=state.get('stop_reason') or ''
     )
     
   
@@ -116,6 +124,7 @@ def save_single_interview_log(state: Dict[str, Any], log_path: str = "interview_
 Grade: {final_report.grade}
 Hiring Recommendation: {final_report.hiring_recommendation}
 Confidence Score: {final_report.confidence_score}%
+Причина завершения: {STOP_REASONS.get(state.get('stop_reason'), '—')}
 
 Б. Hard Skills (Technical Review)
 {final_report.hard_skills_analysis}
@@ -125,6 +134,20 @@ Confidence Score: {final_report.confidence_score}%
 
 Г. Персональный Roadmap (Next Steps)
 {chr(10).join(f"{i+1}. {item}" for i, item in enumerate(final_report.personal_roadmap))}
+"""
+    elif state.get('score_verdict'):
+        # текстовый разбор пишется в фоне, пока в логе только численный вердикт
+        verdict = state['score_verdict']
+        report_note = "Текстовый разбор формируется" if state.get('report_status') == 'pending' else "Текстовый разбор не сформирован"
+        final_feedback = f"""--- ИТОГО ---
+
+А. Вердикт (Decision)
+Grade: {verdict.grade}
+Hiring Recommendation: {verdict.hiring_recommendation}
+Confidence Score: {verdict.confidence_score}%
+Причина завершения: {STOP_REASONS.get(state.get('stop_reason'), '—')}
+
+{report_note}
 """
     else:
         final_feedback = "Интервью не завершено"
@@ -132,7 +155,8 @@ Confidence Score: {final_report.confidence_score}%
     interview_log = InterviewLog(
         participant_name=state['first_request'].name,
         turns=turns,
-        final_feedback=final_feedback.strip()
+        final_feedback=final_feedback.strip(),
+        stop_reason=state.get('stop_reason') or ''
     )
     
     path = Path(log_path)
@@ -160,16 +184,26 @@ class State(Dict[str, Any]):
     turn_count: int
     llm: Any
     final_report: FinalReport = None
+    score_verdict: ScoreVerdict
+    report_status: str
     user_input: str 
     waiting_for_user: True 
     
     difficulty_adjustment: str
     detected_off_topic: str
+    confidence_level: str
+    score_board: ScoreBoard
+    cached_analysis: ThinkingAgentResponse
+    
+    policy_signals: PolicySignals
+    tokens_used: int
+    stop_reason: str
     
     log_file_path: str 
 
 
-def interview_agent(state : Dict[str,Any]) -> Dict[str,Any]: 
+def interview_agent(state : Dict[str,Any], config: RunnableConfig = None) -> Dict[str,Any]: 
+    # без вопроса ответить клиенту нечем, поэтому DeadlineExceeded отсюда уходит наверх (API вернет 504)
 
     system_prompt = '''
 Ты - технический рекрутер в IT компанию, проводишь собеседование.
@@ -217,15 +251,13 @@ def interview_agent(state : Dict[str,Any]) -> Dict[str,Any]:
         SystemMessagePromptTemplate.from_template(system_prompt)
     ])
     
-    chain = prompt | state['llm']
-    
-    response = chain.invoke({
+    response = invoke_llm(prompt, state['llm'], {
         'position': state['first_request'].position,
         'grade': state['first_request'].grade,
         'experience': state['first_request'].experience,
         'context_interview': context_str,
         'difficulty_instruction': difficulty_instruction
-    })
+    }, config, 'interview_agent')
     
     question_text = response.content.strip()
     turn_id = state.get('turn_count', 0) + 1
@@ -241,7 +273,8 @@ def interview_agent(state : Dict[str,Any]) -> Dict[str,Any]:
         **state,
         'current_question': current_question,
         'turn_count': turn_id,
-        'waiting_for_user': True  
+        'waiting_for_user': True,
+        'tokens_used': state.get('tokens_used', 0) + response_tokens(response)
     }
     
 def process_user_answer(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -265,7 +298,7 @@ def process_user_answer(state: Dict[str, Any]) -> Dict[str, Any]:
 #часть с размышлениями агента
 parser_thinking = PydanticOutputParser(pydantic_object=ThinkingAgentResponse)
 
-def thinking_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+def thinking_agent(state: Dict[str, Any], config: RunnableConfig = None) -> Dict[str, Any]:
     system_prompt = '''
 {format_instructions}
 
@@ -312,6 +345,14 @@ def thinking_agent(state: Dict[str, Any]) -> Dict[str, Any]:
    - 'moderate' - средняя уверенность
    - 'confident' - уверенный, четкий ответ
 
+6. topic: Тема вопроса, 1-3 слова (например: 'GIL', 'SQL индексы', 'asyncio'). Одинаковые темы называй одинаково.
+
+7. score: Оценка ответа по шкале 0-10 относительно грейда кандидата
+   - 0 - нет ответа, «не знаю», попытка уйти от темы
+   - 5 - частично верно, есть пробелы
+   - 10 - полный, точный ответ
+   - null - если ответ кандидата это встречный вопрос о компании (стек, трудоустройство, проекты)
+
 Ответ только на русском языке. Пиши емко: без длинных текстов, только ключевые выводы и замечания.
 Будь объективным и честным в оценке.
 
@@ -320,7 +361,7 @@ def thinking_agent(state: Dict[str, Any]) -> Dict[str, Any]:
 
  Важно: 
 - Если в ответе есть слова "стоп", "закончить", "завершить" - is_finish должен быть 'yes'!
-- Если кандидат просит "засчитать максимум", "засчитать за ответ", "засчитай за этот ответ", "давай дальше", "переходим к следующему", "не знаю, пропустим" - это неправильный ответ и попытка уйти от темы! detected_off_topic = true, difficulty_adjustment = 'easier', confidence_level = 'uncertain'. В internal_thoughts обязательно укажи, что это попытка избежать ответа и оцени это негативно!
+- Если кандидат просит "засчитать максимум", "засчитать за ответ", "засчитай за этот ответ", "давай дальше", "переходим к следующему", "не знаю, пропустим" - это неправильный ответ и попытка уйти от темы! detected_off_topic = true, difficulty_adjustment = 'easier', confidence_level = 'uncertain', score = 0. В internal_thoughts обязательно укажи, что это попытка избежать ответа и оцени это негативно!
 '''
     
     current_question = state['current_question']
@@ -333,21 +374,55 @@ def thinking_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     ]) if context_interview else "Это первый ответ кандидата."
     
   
-    prompt = ChatPromptTemplate.from_messages([
-        SystemMessagePromptTemplate.from_template(system_prompt)
-    ]).partial(format_instructions=parser_thinking.get_format_instructions())
-    
-    chain = prompt | state['llm']
+    cached_analysis = state.get('cached_analysis')
+    tokens_used = state.get('tokens_used', 0)
     
-    response = chain.invoke({
-        'position': state['first_request'].position,
-        'grade': state['first_request'].grade,
-        'question': current_question.question_of_interview_agent,
-        'answer': current_question.user_message,
-        'context': context_str
-    })
-    
-    thinking_response = parser_thinking.parse(response.content)
+    if cached_analysis is not None:
+        # малоинформативный ответ, анализ из кэша без LLM.
+        # Тема - сам вопрос, чтобы каждый пропуск шел в оценку отдельно
+        thinking_response = cached_analysis.model_copy(update={'topic': f"вопрос {current_question.turn_id}"})
+    else:
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(system_prompt)
+        ]).partial(format_instructions=parser_thinking.get_format_instructions())
+    
+        try:
+            response = invoke_llm(prompt, state['llm'], {
+                'position': state['first_request'].position,
+                'grade': state['first_request'].grade,
+                'question': current_question.question_of_interview_agent,
+                'answer': current_question.user_message,
+                'context': context_str
+            }, config, 'thinking_agent')
+            thinking_response = parser_thinking.parse(response.content)
+        except (DeadlineExceeded, OutputParserException) as e:
+            # не успели или LLM ответила не по формату - пропускаем анализ:
+            # раунд не оцениваем, сложность оставляем прежней, ответ кандидата остается в истории
+            if isinstance(e, DeadlineExceeded):
+                reason = "не уложились в бюджет времени"
+            else:
+                print(f"Анализ ответа не разобран: {e}")
+                reason = "ответ LLM не по формату"
+            single_turn = Single_turn(
+                turn_id=current_question.turn_id,
+                agent_visible_message=current_question.question_of_interview_agent,
+                user_message=current_question.user_message,
+                internal_thoughts=f"Анализ пропущен: {reason}."
+            )
+            return {
+                **state,
+                'context_interview': context_interview + [single_turn],
+                'is_finish': 'no',
+                'difficulty_adjustment': state.get('difficulty_adjustment', 'same'),
+                'detected_off_topic': False,
+                'confidence_level': None
+            }
+    
+        tokens_used += response_tokens(response)
+        analysis_cache.remember(
+            current_question.user_message, question_class(state), state['first_request'].grade,
+            question_key(state), thinking_response
+        )
     
     single_turn = Single_turn(
         turn_id=current_question.turn_id,
@@ -363,7 +438,11 @@ def thinking_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         'context_interview': updated_context,
         'is_finish': thinking_response.is_finish,
         'difficulty_adjustment': thinking_response.difficulty_adjustment,
-        'detected_off_topic': thinking_response.detected_off_topic
+        'detected_off_topic': thinking_response.detected_off_topic,
+        'confidence_level': thinking_response.confidence_level,
+        'score_board': update_score_board(state.get('score_board'), thinking_response),
+        'tokens_used': tokens_used,
+        'cached_analysis': None
     }
 
 parser_stop_intent = PydanticOutputParser(pydantic_object=StopIntentResponse)
@@ -371,16 +450,17 @@ parser_stop_intent = PydanticOutputParser(pydantic_object=StopIntentResponse)
 
 
 
-def stop_detection_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+def stop_detection_agent(state: Dict[str, Any], config: RunnableConfig = None) -> Dict[str, Any]:
     """
     Агент определяет, хочет ли пользователь завершить интервью
     """
     user_input = (state['current_question'].user_message or '').strip()
     user_lower = user_input.lower()
     
-  
-
-
+    # "не знаю", "давай дальше" и т.п. - результат известен заранее, LLM не зовем ни здесь, ни в thinking_agent
+    cached_analysis = analysis_cache.lookup(user_input, question_class(state), state['first_request'].grade)
+    if cached_analysis is not None:
+        return {**state, 'is_finish': 'no', 'cached_analysis': cached_analysis}
     
     system_prompt = '''
 {format_instructions}
@@ -410,29 +490,76 @@ wants_to_finish = 'no' если это обычный ответ на техни
         SystemMessagePromptTemplate.from_template(system_prompt)
     ]).partial(format_instructions=parser_stop_intent.get_format_instructions())
     
-    chain = prompt | state['llm']
+    try:
+        response = invoke_llm(prompt, state['llm'], {
+            'question': current_question.question_of_interview_agent,
+            'user_answer': current_question.user_message
+        }, config, 'stop_detection_agent')
+    except DeadlineExceeded:
+        # не успели - считаем, что интервью продолжается
+        return {**state, 'is_finish': 'no', 'cached_analysis': None}
     
-    response = chain.invoke({
-        'question': current_question.question_of_interview_agent,
-        'user_answer': current_question.user_message
-    })
+    tokens_used = state.get('tokens_used', 0) + response_tokens(response)
     
     try:
         stop_intent = parser_stop_intent.parse(response.content)
         
         if stop_intent.wants_to_finish.lower().startswith('y'):
-            return {**state, 'is_finish': 'yes'}
+            return {**state, 'is_finish': 'yes', 'stop_reason': 'candidate_request', 'tokens_used': tokens_used, 'cached_analysis': None}
         else:
-            return {**state, 'is_finish': 'no'}
+            return {**state, 'is_finish': 'no', 'tokens_used': tokens_used, 'cached_analysis': None}
     except Exception as e:
-        return {**state, 'is_finish': 'no'}
+        return {**state, 'is_finish': 'no', 'tokens_used': tokens_used, 'cached_analysis': None}
+
+
+def stop_policy_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Без LLM: решает по сигналам thinking_agent и лимитам, пора ли завершать интервью
+    """
+    signals = update_signals(state.get('policy_signals'), state)
+    
+    if state.get('is_finish', 'no').lower().startswith('y'):
+        return {**state, 'policy_signals': signals, 'stop_reason': 'candidate_request'}
+    
+    stop_reason = evaluate_stop_policy(state, signals)
+    if stop_reason:
+        return {**state, 'policy_signals': signals, 'is_finish': 'yes', 'stop_reason': stop_reason}
+    
+    return {**state, 'policy_signals': signals}
 
 
 
-parser_report = PydanticOutputParser(pydantic_object=FinalReport)
 #норм кандидат или нет
 def final_report_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Без LLM: численный вердикт уже накоплен по ходу интервью, отдаем его сразу.
+    Текстовый разбор пишет write_final_report в фоне (класс finalization планировщика)
+    """
+    verdict = score_verdict(state.get('score_board'), state['first_request'].grade)
+    
+    updated_state = {
+        **state,
+        'score_verdict': verdict,
+        'final_report': None,
+        'report_status': 'pending'
+    }
+    
+    # Логируем интервью 
+    log_name = f"interview_log_{state['first_request'].name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    log_path = INTERVIEW_LOGS_DIR / log_name
+    save_single_interview_log(updated_state, log_path=str(log_path))
+    
+    # Сохраняем путь к файлу в состоянии, чтобы FastAPI-слой мог вернуть его в ответе
+    return {**updated_state, 'log_file_path': str(log_path)}
+
+
+parser_report = PydanticOutputParser(pydantic_object=FinalReportNarrative)
 
+def write_final_report(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Текстовая часть финального отчёта по всей истории интервью. Выполняется воркером планировщика LLM
+    уже после того, как кандидат получил численный вердикт; дописывает отчёт в тот же лог
+    """
     system_prompt = '''
 {format_instructions}
 
@@ -447,13 +574,15 @@ def final_report_agent(state: Dict[str, Any]) -> Dict[str, Any]:
 Полная история интервью:
 {full_interview}
 
+Численная оценка уже посчитана по ходу интервью, текст отчёта должен ей соответствовать:
+- Grade: {score_grade}
+- Hiring Recommendation: {score_hiring}
+- Средний балл: {score_average} из 10
+
 Структура отчёта (заполни все поля кратко):
 
 А. Вердикт (Decision)
 - verdict: 1-2 предложения итога.
-- grade: Уровень кандидата по ответам — Junior / Middle / Senior.
-- hiring_recommendation: Hire / No Hire / Strong Hire.
-- confidence_score: Уверенность в оценке 0-100.
 
 Б. Hard Skills (Technical Review)
 - hard_skills_analysis: Список или таблица тем из интервью.
@@ -472,7 +601,7 @@ def final_report_agent(state: Dict[str, Any]) -> Dict[str, Any]:
 '''
     
     context_interview = state['context_interview']
-    
+    verdict = state['score_verdict']
    
     full_interview_str = "\n\n".join([
         f"Раунд {turn.turn_id}:\n"
@@ -487,30 +616,39 @@ def final_report_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         SystemMessagePromptTemplate.from_template(system_prompt)
     ]).partial(format_instructions=parser_report.get_format_instructions())
     
-    chain = prompt | state['llm']
-    
-    response = chain.invoke({
-        'name': state['first_request'].name,
-        'position': state['first_request'].position,
-        'grade': state['first_request'].grade,
-        'experience': state['first_request'].experience,
-        'full_interview': full_interview_str
-    })
-    
-    final_report = parser_report.parse(response.content)
+    try:
+        response = call_llm(prompt, state['llm'], {
+            'name': state['first_request'].name,
+            'position': state['first_request'].position,
+            'grade': state['first_request'].grade,
+            'experience': state['first_request'].experience,
+            'full_interview': full_interview_str,
+            'score_grade': verdict.grade,
+            'score_hiring': verdict.hiring_recommendation,
+            'score_average': verdict.average_score
+        }, time.monotonic() + LLM_TIMEOUT_SECONDS)
+        narrative = parser_report.parse(response.content)
+    except Exception as e:
+        print(f"Текстовый отчёт не сформирован: {e}")
+        updated_state = {**state, 'report_status': 'failed'}
+        save_single_interview_log(updated_state, log_path=state['log_file_path'])
+        return updated_state
+    
+    final_report = FinalReport(
+        **narrative.model_dump(),
+        grade=verdict.grade,
+        hiring_recommendation=verdict.hiring_recommendation,
+        confidence_score=verdict.confidence_score
+    )
 
     updated_state = {
         **state,
-        'final_report': final_report
+        'final_report': final_report,
+        'report_status': 'ready'
     }
+    save_single_interview_log(updated_state, log_path=state['log_file_path'])
     
-    # Логируем интервью 
-    log_name = f"interview_log_{state['first_request'].name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    log_path = INTERVIEW_LOGS_DIR / log_name
-    save_single_interview_log(updated_state, log_path=str(log_path))
-    
-    # Сохраняем путь к файлу в состоянии, чтобы FastAPI-слой мог вернуть его в ответе
-    return {**updated_state, 'log_file_path': str(log_path)}
+    return updated_state
 
 
 def create_interview_graph():
@@ -521,6 +659,7 @@ def create_interview_graph():
   
     workflow.add_node("stop_detection_agent", stop_detection_agent)
     workflow.add_node("thinking_agent", thinking_agent)
+    workflow.add_node("stop_policy_agent", stop_policy_agent)
     workflow.add_node("final_report_agent", final_report_agent)
     
     def check_finish(state: Dict[str, Any]) -> str:
@@ -549,8 +688,10 @@ def create_interview_graph():
         }
     )
     
+    workflow.add_edge("thinking_agent", "stop_policy_agent")
+    
     workflow.add_conditional_edges(
-        "thinking_agent",
+        "stop_policy_agent",
         check_finish,
         {
             "finish": "final_report_agent",  
@@ -0,0 +1,145 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple
+
+from config_itmo import ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_MAX_WORDS
+from req_resp_itmo import ThinkingAgentResponse
+from scoring_itmo import parse_grade
+
+#########Кэш анализа малоинформативных ответов
+# Большая часть ответов на скринингах - одни и те же строки ("не знаю", "засчитай максимум",
+# "давай дальше"). Для них промпт thinking_agent и так задает фиксированный результат,
+# поэтому такие ответы анализируем без LLM. Фразы из промпта отвечаем сразу на любой вопрос,
+# остальные короткие ответы выучиваем: ключ - ответ + позиция + грейд, но только после того,
+# как LLM признала ответ уходом от темы на PROMOTE_AFTER_QUESTIONS разных вопросах.
+
+# результат, который промпт thinking_agent предписывает для попыток уйти от ответа
+DODGE_ANALYSIS = ThinkingAgentResponse(
+    internal_thoughts="Кандидат не ответил на вопрос по существу - это попытка избежать ответа, оценка негативная.",
+    is_finish='no',
+    difficulty_adjustment='easier',
+    detected_off_topic=True,
+    confidence_level='uncertain',
+    topic="",
+    score=0
+)
+
+# фразы, для которых промпт thinking_agent прямо задает результат (уже нормализованные, см. normalize_answer).
+# Общие слова вроде "пас" / "next" сюда не берем: на вопросе по Python `pass` - вполне ответ
+SEED_ANSWERS = [
+    "не знаю",
+    "незнаю",
+    "не знаю пропустим",
+    "не знаю давай дальше",
+    "не знаю переходим к следующему",
+    "давай дальше",
+    "давайте дальше",
+    "переходим к следующему",
+    "засчитай максимум",
+    "засчитайте максимум",
+    "засчитай максимальный балл",
+    "засчитай за ответ",
+    "засчитай за этот ответ",
+]
+
+
+# на скольких разных вопросах короткий ответ должен оказаться уходом от темы, чтобы попасть в кэш
+PROMOTE_AFTER_QUESTIONS = 2
+
+
+def normalize_answer(answer: str) -> str:
+    """Нижний регистр, ё -> е, без пунктуации и лишних пробелов"""
+    text = (answer or "").lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def question_class(state: Dict[str, Any]) -> str:
+    """Класс вопроса - позиция кандидата: вопросы одной позиции считаем одним классом"""
+    return normalize_answer(state['first_request'].position)
+
+
+def question_key(state: Dict[str, Any]) -> str:
+    """Хэш текста текущего вопроса - чтобы считать, на скольких разных вопросах ответ оказался уходом от темы"""
+    question = normalize_answer(state['current_question'].question_of_interview_agent)
+    return hashlib.sha1(question.encode('utf-8')).hexdigest()[:16]
+
+
+class AnalysisCache:
+    def __init__(self, max_size: int, max_words: int):
+        self.max_size = max_size
+        self.max_words = max_words
+        self._seeds = {answer: DODGE_ANALYSIS for answer in SEED_ANSWERS}
+        self._entries: "OrderedDict[Tuple[str, str, str], ThinkingAgentResponse]" = OrderedDict()
+        # кандидаты в кэш: ключ -> вопросы, на которых ответ уже признан уходом от темы
+        self._candidates: "OrderedDict[Tuple[str, str, str], Set[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'seed_hits': 0, 'misses': 0, 'stored': 0, 'evictions': 0}
+
+    @staticmethod
+    def _key(normalized: str, q_class: str, grade: str) -> Tuple[str, str, str]:
+        # грейд из формы - свободный текст: "junior ", "Джун" и "Junior" - одна запись
+        return normalized, q_class, parse_grade(grade)
+
+    def lookup(self, answer: str, q_class: str, grade: str) -> Optional[ThinkingAgentResponse]:
+        normalized = normalize_answer(answer)
+        key = self._key(normalized, q_class, grade)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._metrics['hits'] += 1
+                return self._entries[key]
+            if normalized in self._seeds:
+                self._metrics['hits'] += 1
+                self._metrics['seed_hits'] += 1
+                return self._seeds[normalized]
+            self._metrics['misses'] += 1
+            return None
+
+    def remember(self, answer: str, q_class: str, grade: str, question: str, analysis: ThinkingAgentResponse) -> None:
+        """
+        Учитывает анализ LLM короткого ответа. В кэш ответ попадает, когда LLM признала его уходом
+        от ответа на PROMOTE_AFTER_QUESTIONS разных вопросах подряд; хоть один нормальный ответ - счет сначала.
+        Рассуждения LLM про конкретный вопрос не храним - кладем общий текст DODGE_ANALYSIS
+        """
+        normalized = normalize_answer(answer)
+        if len(normalized.split()) > self.max_words:
+            return
+
+        key = self._key(normalized, q_class, grade)
+        with self._lock:
+            if not analysis.detected_off_topic or analysis.score or analysis.is_finish.lower().startswith('y'):
+                # на этот вопрос такой ответ оказался нормальным - ответ не универсальный уход от темы
+                self._candidates.pop(key, None)
+                return
+
+            questions = self._candidates.pop(key, set()) | {question}
+            if len(questions) < PROMOTE_AFTER_QUESTIONS:
+                self._candidates[key] = questions
+                while len(self._candidates) > self.max_size:
+                    self._candidates.popitem(last=False)
+                return
+
+            self._entries[key] = analysis.model_copy(
+                update={'topic': "", 'internal_thoughts': DODGE_ANALYSIS.internal_thoughts}
+            )
+            self._entries.move_to_end(key)
+            self._metrics['stored'] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._metrics['hits'] + self._metrics['misses']
+            return {
+                **self._metrics,
+                'size': len(self._entries),
+                'candidates': len(self._candidates),
+                'hit_rate': round(self._metrics['hits'] / lookups, 3) if lookups else 0.0
+            }
+
+
+analysis_cache = AnalysisCache(max_size=ANALYSIS_CACHE_SIZE, max_words=ANALYSIS_CACHE_MAX_WORDS)
@@ -5,3 +5,47 @@ load_dotenv(".env")
 
 
 OPEN_AI_API_KEY = os.getenv("OPEN_AI_API_KEY")
+
+# Бюджет времени на один запрос к API (/start, /answer), секунды. Делится между узлами графа
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+# Потолок на один вызов LLM, даже если общий бюджет больше
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "45"))
+# Потоки, в которых выполняются вызовы LLM
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "16"))
+# Доли воркеров LLM по классам приоритета при конкуренции: вопросы кандидатам / финальные отчеты / фоновые задачи
+LLM_WEIGHT_INTERACTIVE = int(os.getenv("LLM_WEIGHT_INTERACTIVE", "6"))
+LLM_WEIGHT_FINALIZATION = int(os.getenv("LLM_WEIGHT_FINALIZATION", "3"))
+LLM_WEIGHT_BACKGROUND = int(os.getenv("LLM_WEIGHT_BACKGROUND", "1"))
+# Задача, ждущая в очереди дольше этого, выполняется вне очереди (защита от голодания)
+LLM_STARVATION_SECONDS = float(os.getenv("LLM_STARVATION_SECONDS", "20"))
+
+# Политика автоматического завершения интервью
+EARLY_STOP_ENABLED = os.getenv("EARLY_STOP_ENABLED", "true").lower() == "true"
+# жесткие лимиты, действуют всегда
+INTERVIEW_MAX_TURNS = int(os.getenv("INTERVIEW_MAX_TURNS", "15"))
+INTERVIEW_MAX_TOKENS = int(os.getenv("INTERVIEW_MAX_TOKENS", "100000"))
+# раньше этого числа ответов досрочно не завершаем
+INTERVIEW_MIN_TURNS = int(os.getenv("INTERVIEW_MIN_TURNS", "4"))
+# сколько раундов подряд вердикт не меняется, чтобы считать оценку устойчивой
+INTERVIEW_STABLE_TURNS = int(os.getenv("INTERVIEW_STABLE_TURNS", "3"))
+INTERVIEW_STOP_CONFIDENCE = int(os.getenv("INTERVIEW_STOP_CONFIDENCE", "70"))
+# по скольким разным темам должны быть оценки, чтобы считать оценку устойчивой
+INTERVIEW_MIN_TOPICS = int(os.getenv("INTERVIEW_MIN_TOPICS", "3"))
+# сколько раундов подряд кандидат уходит от темы / не справляется с упрощенными вопросами
+INTERVIEW_STREAK_LIMIT = int(os.getenv("INTERVIEW_STREAK_LIMIT", "3"))
+
+# Кэш анализа коротких малоинформативных ответов ("не знаю", "давай дальше" и т.п.)
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1000"))
+# ответы длиннее этого (в словах) в кэш не попадают
+ANALYSIS_CACHE_MAX_WORDS = int(os.getenv("ANALYSIS_CACHE_MAX_WORDS", "2"))
+
+# Допуск новых интервью: сколько интервью может идти одновременно, остальные ждут в очереди
+MAX_ACTIVE_SESSIONS = int(os.getenv("MAX_ACTIVE_SESSIONS", "50"))
+# сессия без запросов дольше этого считается брошенной и освобождает место
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+# место в очереди теряется, если клиент не опрашивает его дольше этого
+WAITING_TICKET_TTL_SECONDS = float(os.getenv("WAITING_TICKET_TTL_SECONDS", "60"))
+# средняя длительность интервью для оценки ожидания, пока нет статистики
+EXPECTED_SESSION_SECONDS = float(os.getenv("EXPECTED_SESSION_SECONDS", "900"))
+# как часто frontend опрашивает очередь
+QUEUE_POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", "5"))
@@ -0,0 +1,160 @@
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional
+
+from openai import APITimeoutError, APIConnectionError, RateLimitError, InternalServerError
+
+from config_itmo import LLM_TIMEOUT_SECONDS
+from scheduler_itmo import llm_scheduler, NODE_PRIORITY
+
+#########Дедлайны и отмена запросов
+# Каждый запрос к API получает бюджет времени (Deadline), он передается в граф через
+# config['configurable']['deadline'] и делится между узлами. Если клиент отключился,
+# дедлайн отменяется и оставшиеся узлы не запускаются.
+
+
+class DeadlineExceeded(Exception):
+    """Узел не уложился в свой бюджет времени"""
+
+
+class RequestCancelled(Exception):
+    """Клиент отключился, дальше граф не выполняем"""
+
+
+# относительная "тяжесть" узлов, по ней делим оставшийся бюджет
+NODE_WEIGHTS = {
+    'stop_detection_agent': 1,
+    'thinking_agent': 2,
+    'interview_agent': 2
+}
+
+# какие узлы еще выполнятся после данного на обычном пути (раунд продолжается)
+NODES_AFTER = {
+    'stop_detection_agent': ['thinking_agent', 'interview_agent'],
+    'thinking_agent': ['interview_agent'],
+    'interview_agent': []
+}
+
+# меньше этого даже не пытаемся звать LLM
+MIN_NODE_BUDGET_SECONDS = 1.0
+
+# как часто проверяем отмену, пока ждем LLM
+CANCEL_POLL_SECONDS = 0.2
+
+# сам клиент OpenAI не ретраит (max_retries=0): повторяем сами и только пока бюджет узла не кончился
+LLM_RETRIES = 1
+# ошибки, после которых повтор имеет смысл (APITimeoutError - тоже APIConnectionError)
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise RequestCancelled()
+        if self.remaining() <= 0:
+            raise DeadlineExceeded()
+
+    def node_budget(self, node: str) -> float:
+        """
+        Доля оставшегося времени для узла: пропорционально весу узла среди него и узлов после него
+        """
+        weight = NODE_WEIGHTS.get(node, 1)
+        path_weight = weight + sum(NODE_WEIGHTS[n] for n in NODES_AFTER.get(node, []))
+        return min(self.remaining() * weight / path_weight, LLM_TIMEOUT_SECONDS)
+
+
+def get_deadline(config: Optional[Dict[str, Any]]) -> Optional[Deadline]:
+    return ((config or {}).get('configurable') or {}).get('deadline')
+
+
+def with_deadline(config: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+    """Конфиг графа с дедлайном запроса. Сам конфиг сессии не меняем"""
+    return {
+        **config,
+        'configurable': {**config.get('configurable', {}), 'deadline': deadline}
+    }
+
+
+def call_llm(prompt, llm, inputs: Dict[str, Any], expires_at: float):
+    """
+    prompt | llm с таймаутом HTTP запроса до expires_at. На сетевую ошибку повторяем,
+    только если до expires_at еще есть MIN_NODE_BUDGET_SECONDS
+    """
+    attempt = 0
+    while True:
+        timeout = max(expires_at - time.monotonic(), MIN_NODE_BUDGET_SECONDS)
+        try:
+            return (prompt | llm.bind(timeout=timeout)).invoke(inputs)
+        except RETRYABLE_ERRORS:
+            attempt += 1
+            if attempt > LLM_RETRIES or expires_at - time.monotonic() < MIN_NODE_BUDGET_SECONDS:
+                raise
+
+
+def acquire_within(lock, deadline: Deadline) -> bool:
+    """
+    Ждем lock не дольше оставшегося бюджета запроса. False - не дождались или клиент ушел
+    """
+    while not deadline.cancelled:
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            return False
+        if lock.acquire(timeout=min(remaining, CANCEL_POLL_SECONDS)):
+            return True
+    return False
+
+
+def invoke_llm(prompt, llm, inputs: Dict[str, Any], config: Optional[Dict[str, Any]], node: str):
+    """
+    Вызов prompt | llm через планировщик LLM в рамках бюджета узла (ожидание в очереди тоже входит в бюджет).
+    DeadlineExceeded - не уложились, RequestCancelled - клиент ушел (ждать ответ LLM перестаем сразу)
+    """
+    priority = NODE_PRIORITY.get(node, 'background')
+    deadline = get_deadline(config)
+    if deadline is None:
+        def run_unbounded():
+            return call_llm(prompt, llm, inputs, time.monotonic() + LLM_TIMEOUT_SECONDS)
+        return llm_scheduler.submit(priority, run_unbounded).result()
+
+    deadline.check()
+    budget = deadline.node_budget(node)
+    if budget < MIN_NODE_BUDGET_SECONDS:
+        raise DeadlineExceeded()
+
+    expires_at = time.monotonic() + budget
+
+    def run():
+        # timeout уходит в сам HTTP запрос к OpenAI, чтобы зависший вызов не держал воркер
+        # дольше бюджета узла (вместе с повторами). Время в очереди уже потрачено
+        return call_llm(prompt, llm, inputs, expires_at)
+
+    future = llm_scheduler.submit(priority, run)
+
+    while True:
+        try:
+            return future.result(timeout=CANCEL_POLL_SECONDS)
+        except FutureTimeoutError:
+            pass
+        except APITimeoutError:
+            raise DeadlineExceeded()
+        if deadline.cancelled:
+            future.cancel()
+            raise RequestCancelled()
+        if time.monotonic() >= expires_at:
+            future.cancel()
+            raise DeadlineExceeded()
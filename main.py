@@ -1,16 +1,28 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, Optional, Any
 from pathlib import Path
+from collections import OrderedDict
+import threading
+import asyncio
+import time
 import uuid
-from config_itmo import OPEN_AI_API_KEY
+import hashlib
+from config_itmo import OPEN_AI_API_KEY, REQUEST_DEADLINE_SECONDS, LLM_TIMEOUT_SECONDS, SESSION_IDLE_TTL_SECONDS
 from langchain_openai import ChatOpenAI
-from req_resp_itmo import Request_class
-from agent_itmo import interview_graph
+from req_resp_itmo import Request_class, ScoreBoard, PolicySignals
+from agent_itmo import interview_graph, write_final_report
+from scoring_itmo import score_summary
+from policy_itmo import STOP_REASONS
+from deadline_itmo import Deadline, DeadlineExceeded, RequestCancelled, with_deadline, acquire_within
+from scheduler_itmo import llm_scheduler
+from analysis_cache_itmo import analysis_cache
+from admission_itmo import admission_controller, TicketNotFound, TicketAlreadyClaimed
 
 app = FastAPI(title="AI Interview System")
 
@@ -26,6 +38,37 @@ app.add_middleware(
 #сесси тут держим
 sessions: Dict[str, Dict] = {}
 
+# сколько завершенных ответов на /answer помним в сессии для повторов клиента
+ANSWER_CACHE_SIZE = 20
+
+# счетчики дублей /answer
+answer_metrics: Dict[str, int] = {
+    'deduplicated': 0,
+    'stale_rejected': 0,
+    'finished_rejected': 0,
+    'waited_for_lock': 0,
+    'in_progress_rejected': 0
+}
+answer_metrics_lock = threading.Lock()
+
+
+def inc_metric(name: str) -> None:
+    with answer_metrics_lock:
+        answer_metrics[name] += 1
+
+
+def expire_sessions() -> None:
+    """
+    Удаляем сессии без запросов дольше SESSION_IDLE_TTL_SECONDS (кандидат закрыл вкладку),
+    их места в admission_controller уходят очереди
+    """
+    now = time.monotonic()
+    for session_id, session in list(sessions.items()):
+        if now - session['last_seen'] > SESSION_IDLE_TTL_SECONDS:
+            sessions.pop(session_id, None)
+            interview_graph.checkpointer.delete_thread(session_id)
+            admission_controller.finish(session_id, completed=False)
+
 
 
 LLM_MODEL = 'gpt-4o'
@@ -33,31 +76,92 @@ LLM_MODEL = 'gpt-4o'
 llm = ChatOpenAI(
     api_key=OPEN_AI_API_KEY,
     model=LLM_MODEL,
-    temperature=0.4
+    temperature=0.4,
+    timeout=LLM_TIMEOUT_SECONDS,
+    # повторы делает deadline_itmo.call_llm в пределах бюджета узла
+    max_retries=0
 )
 
+# как часто проверяем, не закрыл ли кандидат вкладку
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+async def run_with_deadline(request: Request, func, *args):
+    """
+    Выполняет синхронную работу с графом в пуле потоков в рамках дедлайна запроса.
+    Если клиент отключился - отменяем дедлайн, граф останавливается на ближайшем вызове LLM
+    """
+    deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+    task = asyncio.ensure_future(run_in_threadpool(func, *args, deadline))
+    
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            break
+        if not deadline.cancelled and await request.is_disconnected():
+            deadline.cancel()
+    
+    try:
+        return task.result()
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Interview agent did not respond in time")
+    except RequestCancelled:
+        # клиента уже нет, этот ответ никто не прочитает
+        raise HTTPException(status_code=499, detail="Client closed request")
+
+
 #да повторил класс 
 class StartRequest(BaseModel):
     name: str
     position: str
     grade: str
     experience: str
+    # билет из очереди ожидания, если /start уже ставил кандидата в очередь
+    ticket_id: Optional[str] = None
 
 class AnswerRequest(BaseModel):
     session_id: str
     answer: str
+    # номер вопроса, на который отвечаем; ответ на старый вопрос отклоняем
+    turn_id: Optional[int] = None
+    # ключ повтора: тот же ключ -> тот же ответ без повторного прогона графа
+    idempotency_key: Optional[str] = None
 
 
 
 @app.post("/start")
-def start_interview(req: StartRequest):
+async def start_interview(req: StartRequest, request: Request):
     """
     Начать интервью. Возвращает session_id и первый вопрос.
+    Если свободных мест нет - возвращает waiting=true, ticket_id, место в очереди и ожидание (eta_seconds).
+    Очередь опрашивается через GET /queue/{ticket_id}, после admitted=true повторите /start с ticket_id.
     
     curl -X POST http://localhost:8000/start \
       -H "Content-Type: application/json" \
       -d '{"name":"Иван","position":"Python Dev","grade":"Junior","experience":"3 месяца и пет проект на django"}'
     """
+    return await run_with_deadline(request, run_start_interview, req)
+
+
+def run_start_interview(req: StartRequest, deadline: Deadline):
+    expire_sessions()
+    
+    try:
+        if req.ticket_id:
+            admission = admission_controller.poll(req.ticket_id, claim=True)
+        else:
+            admission = admission_controller.enter()
+    except TicketNotFound:
+        raise HTTPException(status_code=404, detail="Ticket not found or expired")
+    except TicketAlreadyClaimed:
+        raise HTTPException(status_code=409, detail="Interview for this ticket is already starting")
+    
+    if not admission['admitted']:
+        # мест нет - кандидат ждет в очереди
+        return {'waiting': True, **admission}
+    
+    ticket_id = admission['ticket_id']
+    
     # +++++ Создаем сессию +++++
     session_id = str(uuid.uuid4())
     config = {"configurable": {"thread_id": session_id}}
@@ -77,55 +181,43 @@ def start_interview(req: StartRequest):
         'turn_count': 0,
         'llm': llm,
         'final_report': None,
-        'difficulty_adjustment': 'same'
+        'difficulty_adjustment': 'same',
+        'score_board': ScoreBoard(),
+        'policy_signals': PolicySignals(),
+        'tokens_used': 0
     }
     
     # первый запросик
-    result = interview_graph.invoke(initial_state, config)
+    try:
+        result = interview_graph.invoke(initial_state, with_deadline(config, deadline))
+    except BaseException:
+        admission_controller.release_ticket(ticket_id)
+        raise
     
     #фиксируем сессию
     sessions[session_id] = {
         'config': config,
-        'state': result
+        'state': result,
+        'lock': threading.Lock(),
+        'responses': OrderedDict(),
+        'last_seen': time.monotonic()
     }
+    admission_controller.activate(ticket_id, session_id)
     
     return {
+        'waiting': False,
         'session_id': session_id,
         'question': result['current_question'].question_of_interview_agent,
         'turn_id': result['turn_count']
     }
 
 
-@app.post("/answer")
-def submit_answer(req: AnswerRequest):
-    """
-    Отправить ответ. Возвращает следующий вопрос или финальный отчет.
-    
-    curl -X POST http://localhost:8000/answer \
-      -H "Content-Type: application/json" \
-      -d '{"session_id":"xxx","answer":"мой ответ"}'
-    """
-    # проверяем сессию
-    if req.session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    session = sessions[req.session_id]
-    
-    current_state = session['state']
-    current_state['user_input'] = req.answer
-    
-  
-    result = interview_graph.invoke(
-        current_state,
-        session['config']
-    )
-    
-    session['state'] = result
-    
-
+def build_answer_response(result: Dict[str, Any]) -> Dict[str, Any]:
     if result.get('is_finish', 'no').lower().startswith('y'):
 
-        report = result['final_report']
+        # численный вердикт посчитан локально и есть сразу, текст отчета может еще писаться в фоне
+        verdict = result['score_verdict']
+        report = result.get('final_report')
 
         # Путь к JSON-логу, который сохранил граф (final_report_agent)
         log_file_path = result.get('log_file_path')
@@ -138,13 +230,16 @@ def submit_answer(req: AnswerRequest):
         return {
             'finished': True,
             'log_file': log_file,
-            'verdict': report.verdict,
-            'grade': report.grade,
-            'hiring_recommendation': report.hiring_recommendation,
-            'confidence_score': report.confidence_score,
-            'hard_skills': report.hard_skills_analysis,
-            'soft_skills': report.soft_skills_analysis,
-            'roadmap': report.personal_roadmap
+            'stop_reason': result.get('stop_reason'),
+            'stop_reason_text': STOP_REASONS.get(result.get('stop_reason')),
+            'grade': verdict.grade,
+            'hiring_recommendation': verdict.hiring_recommendation,
+            'confidence_score': verdict.confidence_score,
+            'report_status': result.get('report_status'),
+            'verdict': report.verdict if report else None,
+            'hard_skills': report.hard_skills_analysis if report else None,
+            'soft_skills': report.soft_skills_analysis if report else None,
+            'roadmap': report.personal_roadmap if report else None
         }
     
 
@@ -155,6 +250,172 @@ def submit_answer(req: AnswerRequest):
     }
 
 
+def schedule_final_report(session_id: str, state: Dict[str, Any]) -> None:
+    """
+    Текстовый отчет пишем в фоне воркером планировщика (класс finalization),
+    готовый отчет кладем в сессию - его отдает GET /report/{session_id}
+    """
+    def attach(future) -> None:
+        session = sessions.get(session_id)
+        if session is not None and not future.exception():
+            session['state'] = future.result()
+    
+    llm_scheduler.submit('finalization', write_final_report, state).add_done_callback(attach)
+
+
+@app.post("/answer")
+async def submit_answer(req: AnswerRequest, request: Request):
+    """
+    Отправить ответ. Возвращает следующий вопрос или финальный отчет.
+    Запросы одной сессии выполняются по очереди. Повтор с тем же idempotency_key (или turn_id)
+    возвращает уже посчитанный ответ, ответ на устаревший turn_id отклоняется с 409.
+    
+    curl -X POST http://localhost:8000/answer \
+      -H "Content-Type: application/json" \
+      -d '{"session_id":"xxx","answer":"мой ответ","turn_id":1,"idempotency_key":"xxx-1"}'
+    """
+    return await run_with_deadline(request, run_submit_answer, req)
+
+
+def run_submit_answer(req: AnswerRequest, deadline: Deadline):
+    # проверяем сессию
+    if req.session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    session = sessions[req.session_id]
+    session['last_seen'] = time.monotonic()
+    
+    if req.idempotency_key:
+        cache_key = f"key:{req.idempotency_key}"
+    elif req.turn_id is not None:
+        cache_key = f"turn:{req.turn_id}"
+    else:
+        cache_key = None
+    
+    # двойной клик / ретрай ждут первый запрос, а потом забирают его результат из кэша.
+    # Ждем только в пределах своего дедлайна: не дождались или клиент ушел - 409, пусть повторит позже
+    if not session['lock'].acquire(blocking=False):
+        inc_metric('waited_for_lock')
+        if not acquire_within(session['lock'], deadline):
+            inc_metric('in_progress_rejected')
+            raise HTTPException(status_code=409, detail="Answer for this session is already being processed")
+    
+    try:
+        # повтор отдаем из кэша, только если это тот же ответ. Другой текст с тем же turn_id -
+        # ответ из второй вкладки на уже пройденный вопрос
+        answer_hash = hashlib.sha1(req.answer.encode('utf-8')).hexdigest()
+        if cache_key and cache_key in session['responses']:
+            cached_hash, cached_response = session['responses'][cache_key]
+            if cached_hash != answer_hash:
+                inc_metric('stale_rejected')
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"This turn was already answered with a different answer, current turn is {session['state']['turn_count']}"
+                )
+            inc_metric('deduplicated')
+            return cached_response
+        
+        current_state = session['state']
+        
+        if current_state.get('is_finish', 'no').lower().startswith('y'):
+            inc_metric('finished_rejected')
+            raise HTTPException(status_code=409, detail="Interview already finished")
+        
+        if req.turn_id is not None and req.turn_id != current_state['turn_count']:
+            inc_metric('stale_rejected')
+            raise HTTPException(
+                status_code=409,
+                detail=f"Stale turn_id {req.turn_id}, current turn is {current_state['turn_count']}"
+            )
+        
+        # состояние сессии не мутируем: если граф упадет, сессия останется как была
+        result = interview_graph.invoke(
+            {**current_state, 'user_input': req.answer},
+            with_deadline(session['config'], deadline)
+        )
+        
+        session['state'] = result
+        session['last_seen'] = time.monotonic()
+        response = build_answer_response(result)
+        
+        if response['finished']:
+            # место освобождается для следующего в очереди
+            admission_controller.finish(req.session_id)
+            schedule_final_report(req.session_id, result)
+        
+        if cache_key:
+            session['responses'][cache_key] = (answer_hash, response)
+            while len(session['responses']) > ANSWER_CACHE_SIZE:
+                session['responses'].popitem(last=False)
+        
+        return response
+    finally:
+        session['lock'].release()
+
+
+@app.get("/report/{session_id}")
+def get_report(session_id: str):
+    """
+    Итог интервью. Численный вердикт есть сразу, текст отчета - когда report_status станет 'ready'.
+    
+    curl http://localhost:8000/report/xxx
+    """
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    state = sessions[session_id]['state']
+    if not state.get('is_finish', 'no').lower().startswith('y'):
+        raise HTTPException(status_code=409, detail="Interview not finished")
+    
+    return build_answer_response(state)
+
+
+@app.get("/queue/{ticket_id}")
+def get_queue_status(ticket_id: str):
+    """
+    Место в очереди на интервью. admitted=true - место выделено, запускайте /start с этим ticket_id.
+    
+    curl http://localhost:8000/queue/xxx
+    """
+    expire_sessions()
+    
+    try:
+        return admission_controller.poll(ticket_id)
+    except TicketNotFound:
+        raise HTTPException(status_code=404, detail="Ticket not found or expired")
+    except TicketAlreadyClaimed:
+        return {'admitted': True, 'ticket_id': ticket_id}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Счетчики сервиса"""
+    with answer_metrics_lock:
+        answer = dict(answer_metrics)
+    return {
+        'answer': answer,
+        'llm_scheduler': llm_scheduler.stats(),
+        'analysis_cache': analysis_cache.stats(),
+        'admission': admission_controller.stats()
+    }
+
+
+@app.get("/score/{session_id}")
+def get_score(session_id: str):
+    """
+    Текущая численная оценка кандидата. Считается локально, работает и посреди интервью.
+    
+    curl http://localhost:8000/score/xxx
+    """
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return {
+        'session_id': session_id,
+        **score_summary(sessions[session_id]['state'])
+    }
+
+
 # Раздача статических файлов (frontend)
 static_dir = Path(__file__).parent
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
@@ -169,7 +430,11 @@ def root():
         'message': 'AI Interview System',
         'endpoints': {
             'POST /start': 'Начать интервью',
-            'POST /answer': 'Отправить ответ'
+            'POST /answer': 'Отправить ответ',
+            'GET /queue/{ticket_id}': 'Место в очереди на интервью',
+            'GET /score/{session_id}': 'Текущая оценка',
+            'GET /report/{session_id}': 'Итоговый отчет',
+            'GET /metrics': 'Счетчики сервиса'
         }
     }
 
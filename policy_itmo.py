@@ -0,0 +1,101 @@
+from typing import Dict, Any, Optional
+
+from config_itmo import (
+    EARLY_STOP_ENABLED, INTERVIEW_MAX_TURNS, INTERVIEW_MAX_TOKENS, INTERVIEW_MIN_TURNS,
+    INTERVIEW_STABLE_TURNS, INTERVIEW_STOP_CONFIDENCE, INTERVIEW_MIN_TOPICS, INTERVIEW_STREAK_LIMIT
+)
+from req_resp_itmo import StopPolicy, PolicySignals
+from scoring_itmo import score_verdict
+
+#########Политика автоматического завершения интервью
+# После каждого анализа ответа смотрим на сигналы thinking_agent и накопленную оценку.
+# Если оценка уже устойчива или вышли за лимиты - завершаем интервью через final_report_agent.
+
+DEFAULT_POLICY = StopPolicy(
+    early_stop_enabled=EARLY_STOP_ENABLED,
+    max_turns=INTERVIEW_MAX_TURNS,
+    max_tokens=INTERVIEW_MAX_TOKENS,
+    min_turns=INTERVIEW_MIN_TURNS,
+    stable_turns=INTERVIEW_STABLE_TURNS,
+    stop_confidence=INTERVIEW_STOP_CONFIDENCE,
+    min_topics=INTERVIEW_MIN_TOPICS,
+    streak_limit=INTERVIEW_STREAK_LIMIT
+)
+
+# коды причин завершения -> текст для лога
+STOP_REASONS = {
+    'candidate_request': 'Кандидат попросил завершить интервью',
+    'max_turns': 'Достигнут лимит вопросов',
+    'token_budget': 'Исчерпан бюджет токенов на интервью',
+    'off_topic': 'Кандидат несколько раундов подряд уходил от темы',
+    'struggling': 'Кандидат несколько раундов подряд не справляется даже с упрощенными вопросами',
+    'converged': 'Оценка кандидата стабилизировалась'
+}
+
+
+def response_tokens(response) -> int:
+    """Сколько токенов потратил вызов LLM (если провайдер это вернул)"""
+    usage = getattr(response, 'usage_metadata', None) or {}
+    return usage.get('total_tokens', 0)
+
+
+def update_signals(signals: Optional[PolicySignals], state: Dict[str, Any]) -> PolicySignals:
+    """
+    Обновляет серии сигналов по результату последнего анализа. Новый объект, старый не трогаем
+    """
+    signals = signals.model_copy() if signals is not None else PolicySignals()
+
+    # анализ пропущен (не уложились в бюджет) - сигналов за раунд нет
+    if state.get('confidence_level') is None:
+        return signals
+
+    if state.get('detected_off_topic'):
+        signals.off_topic_streak += 1
+    else:
+        signals.off_topic_streak = 0
+
+    if state.get('difficulty_adjustment') == 'easier' and state.get('confidence_level') == 'uncertain':
+        signals.struggle_streak += 1
+    else:
+        signals.struggle_streak = 0
+
+    verdict = score_verdict(state.get('score_board'), state['first_request'].grade)
+    verdict_key = f"{verdict.grade}/{verdict.hiring_recommendation}"
+    if verdict.answered and verdict_key == signals.last_verdict:
+        signals.stable_turns += 1
+    else:
+        signals.stable_turns = 1 if verdict.answered else 0
+    signals.last_verdict = verdict_key
+
+    return signals
+
+
+def evaluate_stop_policy(state: Dict[str, Any], signals: PolicySignals, policy: StopPolicy = DEFAULT_POLICY) -> Optional[str]:
+    """
+    Возвращает код причины завершения или None, если интервью продолжаем
+    """
+    turns = len(state.get('context_interview', []))
+
+    if turns >= policy.max_turns:
+        return 'max_turns'
+    if state.get('tokens_used', 0) >= policy.max_tokens:
+        return 'token_budget'
+
+    if not policy.early_stop_enabled or turns < policy.min_turns:
+        return None
+
+    if signals.off_topic_streak >= policy.streak_limit:
+        return 'off_topic'
+    if signals.struggle_streak >= policy.streak_limit:
+        return 'struggling'
+
+    # устойчивая оценка по одной-двум темам - еще не оценка кандидата
+    board = state.get('score_board')
+    if board is None or len(board.topics) < policy.min_topics:
+        return None
+
+    verdict = score_verdict(board, state['first_request'].grade)
+    if signals.stable_turns >= policy.stable_turns and verdict.confidence_score >= policy.stop_confidence:
+        return 'converged'
+
+    return None
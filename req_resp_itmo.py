@@ -1,5 +1,5 @@
 from pydantic import BaseModel, HttpUrl, Field
-from typing import List,Optional, Any ,Literal
+from typing import List,Optional, Any ,Literal, Dict
 
 class Single_turn(BaseModel):
     turn_id : int
@@ -26,6 +26,8 @@ class ThinkingAgentResponse(BaseModel):
     difficulty_adjustment: Literal['easier', 'same', 'harder']
     detected_off_topic: bool
     confidence_level: Literal['uncertain', 'moderate', 'confident']
+    topic: str = Field(default="общее", description="Тема вопроса, 1-3 слова (например: 'GIL', 'SQL индексы')")
+    score: Optional[float] = Field(default=None, ge=0, le=10, description="Оценка ответа 0-10; null, если кандидат задал встречный вопрос о компании")
 
 class StopIntentResponse(BaseModel):
     wants_to_finish: str = Field(description="'yes' если пользователь хочет завершить интервью, 'no' если это обычный ответ на вопрос")
@@ -37,13 +39,57 @@ class Response_class(BaseModel): #мб удалить
     turns : List[Single_turn]
     final_feedback : str
 
-class FinalReport(BaseModel):
-    """Финальный отчёт интервью. Все поля — кратко, по делу."""
+class TopicScore(BaseModel):
+    #сумма оценок по одной теме
+    answers: int = 0
+    total: int = 0
+
+
+class ScoreBoard(BaseModel):
+    """Оценки thinking_agent, накопленные по ходу интервью. Обновляется каждый раунд без вызова LLM."""
+
+    topics: Dict[str, TopicScore] = Field(default_factory=dict)
+    answered: int = 0
+    total: int = 0
+    total_sq: int = 0
+    off_topic: int = 0
+    confidence_levels: Dict[str, int] = Field(default_factory=dict)
+
+
+class ScoreVerdict(BaseModel):
+    #численный вердикт, считается локально из ScoreBoard
+    grade: Literal["Junior", "Middle", "Senior"]
+    hiring_recommendation: Literal["Hire", "No Hire", "Strong Hire"]
+    confidence_score: int = Field(ge=0, le=100)
+    average_score: float
+    answered: int
+
+
+class StopPolicy(BaseModel):
+    """Настройки автоматического завершения интервью. Значения берутся из config_itmo (policy_itmo.DEFAULT_POLICY)"""
+
+    early_stop_enabled: bool
+    max_turns: int
+    max_tokens: int
+    min_turns: int
+    stable_turns: int
+    stop_confidence: int
+    min_topics: int
+    streak_limit: int
+
+
+class PolicySignals(BaseModel):
+    #сигналы thinking_agent, накопленные для политики завершения
+    struggle_streak: int = 0
+    off_topic_streak: int = 0
+    stable_turns: int = 0
+    last_verdict: Optional[str] = None
+
+
+class FinalReportNarrative(BaseModel):
+    """Текстовая часть финального отчёта, её пишет LLM. Все поля — кратко, по делу."""
 
     verdict: str = Field(description="Краткий итоговый вердикт, 1-2 предложения")
-    grade: Literal["Junior", "Middle", "Senior"] = Field(description="Оценка уровня кандидата по ответам")
-    hiring_recommendation: Literal["Hire", "No Hire", "Strong Hire"] = Field(description="Рекомендация по найму")
-    confidence_score: int = Field(ge=0, le=100, description="Уверенность системы в оценке, 0-100%")
     hard_skills_analysis: str = Field(
         description="Technical Review: ✅ Confirmed Skills (темы с точными ответами); ❌ Knowledge Gaps (темы с ошибками/«не знаю» + правильный ответ). Кратко, списком или таблицей."
     )
@@ -55,6 +101,14 @@ class FinalReport(BaseModel):
     )  
 
 
+class FinalReport(FinalReportNarrative):
+    """Финальный отчёт интервью: текст от LLM + численный вердикт из ScoreBoard."""
+
+    grade: Literal["Junior", "Middle", "Senior"] = Field(description="Оценка уровня кандидата по ответам")
+    hiring_recommendation: Literal["Hire", "No Hire", "Strong Hire"] = Field(description="Рекомендация по найму")
+    confidence_score: int = Field(ge=0, le=100, description="Уверенность системы в оценке, 0-100%")
+
+
 class LogTurn(BaseModel):
    
     turn_id: int
@@ -67,3 +121,4 @@ class InterviewLog(BaseModel):
     participant_name: str
     turns: List[LogTurn]
     final_feedback: str = ""
+    stop_reason: str = ""
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, List
+
+from config_itmo import (
+    LLM_WORKERS, LLM_WEIGHT_INTERACTIVE, LLM_WEIGHT_FINALIZATION, LLM_WEIGHT_BACKGROUND,
+    LLM_STARVATION_SECONDS
+)
+
+#########Планировщик вызовов LLM
+# Все вызовы LLM идут через общий пул воркеров с очередями по классам приоритета:
+# interactive (следующий вопрос кандидату) > finalization (финальный отчет) > background (фоновые задачи).
+# Свободный воркер берет задачу по весам классов (взвешенная очередь), задача, ждущая дольше
+# LLM_STARVATION_SECONDS, берется вне очереди. Кроме того, неинтерактивные классы одновременно
+# занимают не больше workers * weight / sum(weights) воркеров: остальные всегда свободны
+# для вопросов кандидатам, даже если накопилась очередь финальных отчетов.
+
+PRIORITY_CLASSES = ['interactive', 'finalization', 'background']
+
+# в какой класс попадает вызов LLM из узла графа.
+# Финальный отчет пишется вне графа и ставится в класс finalization напрямую (main.schedule_final_report)
+NODE_PRIORITY = {
+    'interview_agent': 'interactive',
+    'stop_detection_agent': 'interactive',
+    'thinking_agent': 'interactive'
+}
+
+# сколько последних ожиданий храним для перцентилей
+LATENCY_SAMPLES = 500
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index], 3)
+
+
+class LLMScheduler:
+    def __init__(self, workers: int, weights: Dict[str, int], starvation_seconds: float):
+        self.weights = weights
+        self.starvation_seconds = starvation_seconds
+        self._queues = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._credits = dict(weights)
+        self._running = {cls: 0 for cls in PRIORITY_CLASSES}
+        # лимит одновременно выполняемых задач класса, None - без лимита
+        self._max_running = {
+            cls: None if cls == 'interactive' else max(1, workers * weights[cls] // sum(weights.values()))
+            for cls in PRIORITY_CLASSES
+        }
+        self._cond = threading.Condition()
+        self._metrics = {
+            cls: {
+                'submitted': 0,
+                'completed': 0,
+                'failed': 0,
+                'cancelled': 0,
+                'starvation_promoted': 0,
+                'wait': deque(maxlen=LATENCY_SAMPLES),
+                'run': deque(maxlen=LATENCY_SAMPLES)
+            }
+            for cls in PRIORITY_CLASSES
+        }
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"llm-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, priority: str, fn: Callable, *args) -> Future:
+        """
+        Ставит fn(*args) в очередь класса priority. future.cancel() убирает задачу, пока она не начала выполняться
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        future = Future()
+        with self._cond:
+            self._queues[priority].append((time.monotonic(), future, fn, args))
+            self._metrics[priority]['submitted'] += 1
+            self._cond.notify()
+        return future
+
+    def _can_start(self, cls: str) -> bool:
+        """У класса есть задачи и он не упирается в свой лимит воркеров"""
+        limit = self._max_running[cls]
+        return bool(self._queues[cls]) and (limit is None or self._running[cls] < limit)
+
+    def _next_job(self):
+        """Выбор следующей задачи или None, если брать нечего. Вызывается под self._cond"""
+        ready = [cls for cls in PRIORITY_CLASSES if self._can_start(cls)]
+        if not ready:
+            return None
+        now = time.monotonic()
+
+        # защита от голодания: самая старая задача среди доступных очередей, если ждет слишком долго
+        oldest_cls = min(ready, key=lambda cls: self._queues[cls][0][0])
+        if now - self._queues[oldest_cls][0][0] >= self.starvation_seconds:
+            self._metrics[oldest_cls]['starvation_promoted'] += 1
+            return oldest_cls, self._queues[oldest_cls].popleft()
+
+        # взвешенная очередь: по порядку приоритета, пока у класса есть кредиты
+        for _ in range(2):
+            for cls in ready:
+                if self._credits[cls] > 0:
+                    self._credits[cls] -= 1
+                    return cls, self._queues[cls].popleft()
+            # у всех доступных классов кредиты кончились - новый цикл
+            self._credits = dict(self.weights)
+
+        return ready[0], self._queues[ready[0]].popleft()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                cls, (submitted_at, future, fn, args) = job
+                self._running[cls] += 1
+
+            if not future.set_running_or_notify_cancel():
+                # пока ждали в очереди, запрос отменили (дедлайн или клиент ушел)
+                with self._cond:
+                    self._running[cls] -= 1
+                    self._metrics[cls]['cancelled'] += 1
+                    self._cond.notify_all()
+                continue
+
+            started_at = time.monotonic()
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+                outcome = 'failed'
+            else:
+                future.set_result(result)
+                outcome = 'completed'
+
+            with self._cond:
+                # освободился слот класса - задачи, упершиеся в лимит, снова можно брать
+                self._running[cls] -= 1
+                self._cond.notify_all()
+                metrics = self._metrics[cls]
+                metrics[outcome] += 1
+                metrics['wait'].append(started_at - submitted_at)
+                metrics['run'].append(time.monotonic() - started_at)
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очередей и задержки по классам (секунды)"""
+        with self._cond:
+            return {
+                cls: {
+                    'queue_depth': len(self._queues[cls]),
+                    'weight': self.weights[cls],
+                    'running': self._running[cls],
+                    'max_running': self._max_running[cls],
+                    'submitted': metrics['submitted'],
+                    'completed': metrics['completed'],
+                    'failed': metrics['failed'],
+                    'cancelled': metrics['cancelled'],
+                    'starvation_promoted': metrics['starvation_promoted'],
+                    'wait_p50': percentile(list(metrics['wait']), 0.5),
+                    'wait_p95': percentile(list(metrics['wait']), 0.95),
+                    'run_p50': percentile(list(metrics['run']), 0.5),
+                    'run_p95': percentile(list(metrics['run']), 0.95)
+                }
+                for cls, metrics in self._metrics.items()
+            }
+
+
+llm_scheduler = LLMScheduler(
+    workers=LLM_WORKERS,
+    weights={
+        'interactive': LLM_WEIGHT_INTERACTIVE,
+        'finalization': LLM_WEIGHT_FINALIZATION,
+        'background': LLM_WEIGHT_BACKGROUND
+    },
+    starvation_seconds=LLM_STARVATION_SECONDS
+)
@@ -0,0 +1,126 @@
+import math
+from typing import Dict, Any, Optional
+
+from req_resp_itmo import ScoreBoard, TopicScore, ScoreVerdict, ThinkingAgentResponse
+
+#########Локальная агрегация оценок
+# thinking_agent каждый раунд ставит оценку 0-10 по теме вопроса,
+# здесь мы их копим и считаем вердикт без отдельного вызова LLM
+
+GRADES = ["Junior", "Middle", "Senior"]
+
+# после скольких оцененных ответов считаем, что покрытие полное
+FULL_COVERAGE_ANSWERS = 5
+
+STRONG_HIRE_SCORE = 8.5
+HIRE_SCORE = 6.0
+DOWNGRADE_SCORE = 4.0
+
+
+def update_score_board(board: Optional[ScoreBoard], thinking_response: ThinkingAgentResponse) -> ScoreBoard:
+    """
+    Добавляет оценку раунда в ScoreBoard. Возвращает новый объект, старый не трогаем (он лежит в чекпоинте графа)
+    """
+    board = board.model_copy(deep=True) if board is not None else ScoreBoard()
+
+    level = thinking_response.confidence_level
+    board.confidence_levels[level] = board.confidence_levels.get(level, 0) + 1
+    if thinking_response.detected_off_topic:
+        board.off_topic += 1
+
+    # встречный вопрос о компании - не оцениваем
+    if thinking_response.score is None:
+        return board
+
+    # LLM может поставить и 7.5 - в таблице храним целые, округляем половину вверх
+    score = math.floor(thinking_response.score + 0.5)
+    topic = thinking_response.topic.strip().lower() or "общее"
+    topic_score = board.topics.setdefault(topic, TopicScore())
+    topic_score.answers += 1
+    topic_score.total += score
+
+    board.answered += 1
+    board.total += score
+    board.total_sq += score * score
+    return board
+
+
+def parse_grade(grade: str) -> str:
+    """Грейд из формы - свободный текст, приводим к Junior/Middle/Senior"""
+    grade_lower = (grade or "").lower()
+    if "sen" in grade_lower or "сеньор" in grade_lower or "синьор" in grade_lower:
+        return "Senior"
+    if "jun" in grade_lower or "джун" in grade_lower:
+        return "Junior"
+    return "Middle"
+
+
+def topic_averages(board: ScoreBoard) -> Dict[str, float]:
+    return {
+        topic: round(topic_score.total / topic_score.answers, 2)
+        for topic, topic_score in board.topics.items()
+        if topic_score.answers
+    }
+
+
+def score_verdict(board: Optional[ScoreBoard], declared_grade: str) -> ScoreVerdict:
+    """
+    Численный вердикт по накопленным оценкам. Дешево, можно звать на каждом раунде
+    """
+    board = board or ScoreBoard()
+    declared = parse_grade(declared_grade)
+
+    if board.answered == 0:
+        return ScoreVerdict(
+            grade=declared,
+            hiring_recommendation="No Hire",
+            confidence_score=0,
+            average_score=0.0,
+            answered=0
+        )
+
+    # каждая тема с одинаковым весом, чтобы уточняющие вопросы по одной теме не перевешивали
+    averages = topic_averages(board)
+    average = sum(averages.values()) / len(averages)
+
+    confident_share = board.confidence_levels.get('confident', 0) / max(sum(board.confidence_levels.values()), 1)
+
+    grade_index = GRADES.index(declared)
+    if average >= STRONG_HIRE_SCORE and confident_share >= 0.5:
+        grade_index = min(grade_index + 1, len(GRADES) - 1)
+    elif average < DOWNGRADE_SCORE:
+        grade_index = max(grade_index - 1, 0)
+
+    if average >= STRONG_HIRE_SCORE:
+        hiring_recommendation = "Strong Hire"
+    elif average >= HIRE_SCORE:
+        hiring_recommendation = "Hire"
+    else:
+        hiring_recommendation = "No Hire"
+
+    # уверенность: сколько ответов оценено и насколько оценки согласованы
+    mean = board.total / board.answered
+    variance = max(board.total_sq / board.answered - mean * mean, 0.0)
+    consistency = 1 - min(math.sqrt(variance) / 5, 1)
+    coverage = min(board.answered / FULL_COVERAGE_ANSWERS, 1)
+    confidence_score = round(100 * coverage * (0.5 + 0.5 * consistency))
+
+    return ScoreVerdict(
+        grade=GRADES[grade_index],
+        hiring_recommendation=hiring_recommendation,
+        confidence_score=confidence_score,
+        average_score=round(average, 2),
+        answered=board.answered
+    )
+
+
+def score_summary(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Текущая оценка сессии для API (в т.ч. посреди интервью)"""
+    board = state.get('score_board') or ScoreBoard()
+    verdict = score_verdict(board, state['first_request'].grade)
+    return {
+        **verdict.model_dump(),
+        'topics': topic_averages(board),
+        'off_topic': board.off_topic,
+        'confidence_levels': board.confidence_levels
+    }